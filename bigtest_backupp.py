@@ -1,98 +1,211 @@
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify, Response, stream_with_context
 import json
+import logging
+import math
+import orjson
+import random
 import re
 import os
 import subprocess
 import tempfile
+import multiprocessing
 app = Flask(__name__)
 import dotenv
+from proxy_common import OrjsonProvider, ModelsCache, read_json_body, sse_prefix, sse_chunk
 
 dotenv.load_dotenv()
 
+logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", handlers=[logging.StreamHandler()])
+log = logging.getLogger("proxy")
+log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
 A4F_API_KEY = os.getenv("A4F_API_KEY") # Configure the API key in .env directly or just paste the key in quotes here.
 MODEL_LIST_ENDPOINT = "https://api.a4f.co/v1/models"
 CHAT_COMPLETION_ENDPOINT = "https://api.a4f.co/v1/chat/completions"
 
+# Shared session so every call to the provider reuses pooled keep-alive connections
+# instead of paying a fresh TCP + TLS handshake per request.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=0))
+SESSION.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+# Fail fast when the provider is unreachable; read timeouts stay per call since completions can be slow.
+CONNECT_TIMEOUT = 5
+
+SSE_CHUNK_SIZE = 16384
+SSE_PREFIX = b"data: "
+SSE_SEP = b"\n\n"
+
+# Provider responses worth retrying; any other 4xx is returned to the caller immediately.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 30
+
+# Keys every relayed chunk must carry; chunks that already contain all of them are forwarded untouched.
+REQUIRED_CHUNK_KEYS = (b'"id"', b'"object"', b'"created"', b'"model"', b'"index"', b'"finish_reason"')
+
+def iter_sse_lines(r):
+    """Yield the non-empty lines of a streamed SSE response as raw bytes.
+
+    Reads the body in large chunks and splits them on b"\\n", stripping a trailing b"\\r" so
+    CRLF-framed streams work too. Nothing is decoded and a partial line is carried over to the next chunk.
+    """
+    pending = b""
+    for chunk in r.iter_content(chunk_size=SSE_CHUNK_SIZE):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line:
+                yield line
+    # Flush a trailing line the provider did not terminate with a newline
+    pending = pending.rstrip(b"\r")
+    if pending:
+        yield pending
+
 class AIEngine:
     MAX_RETRIES = 3
     BASE_BACKOFF = 5
     COOLDOWN_SECONDS = 10
-    _api_call_count = 0
-    _last_cooldown_time = 0
+    REQUESTS_PER_WINDOW = 5
+    # Monotonic admission times of the last REQUESTS_PER_WINDOW requests, as a ring buffer in shared
+    # memory: the limit holds across threads and across gunicorn workers forked from a --preload parent
+    _recent_requests = multiprocessing.Array("d", [-math.inf] * REQUESTS_PER_WINDOW, lock=False)
+    _next_slot = multiprocessing.Value("i", 0, lock=False)
+    _rate_lock = multiprocessing.Lock()
 
     def __init__(self, api_key, chat_endpoint):
         self.api_key = api_key
         self.chat_endpoint = chat_endpoint
+        # Built once and shared by every provider call
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        # Compressed SSE would be buffered by the provider, so streaming calls ask for identity
+        self.stream_headers = {**self.headers, "Accept-Encoding": "identity"}
 
     def _maybe_cooldown(self):
-        self.__class__._api_call_count += 1
-        if self.__class__._api_call_count % 5 == 0:
-            now = time.time()
-            if now - self.__class__._last_cooldown_time > 1:
-                print(f"[AIEngine] ⏳ cooldown: {self.COOLDOWN_SECONDS}s after 5 requests...")
-                for i in range(self.COOLDOWN_SECONDS, 0, -1):
-                    print(f"[AIEngine]   ...{i}s remaining", end='\r', flush=True)
-                    time.sleep(1)
-                print("[AIEngine]   ...0s remaining          ")
-                self.__class__._last_cooldown_time = time.time()
+        """Admit at most REQUESTS_PER_WINDOW requests per sliding COOLDOWN_SECONDS window.
+
+        Returns 0 and records the request when a slot is free, otherwise the seconds until the
+        oldest request leaves the window. Never sleeps, so no worker thread is held up.
+        """
+        cls = self.__class__
+        with cls._rate_lock:
+            now = time.monotonic()
+            # The slot about to be overwritten holds the oldest of the last REQUESTS_PER_WINDOW admissions
+            slot = cls._next_slot.value
+            elapsed = now - cls._recent_requests[slot]
+            if elapsed < self.COOLDOWN_SECONDS:
+                return self.COOLDOWN_SECONDS - elapsed
+            cls._recent_requests[slot] = now
+            cls._next_slot.value = (slot + 1) % self.REQUESTS_PER_WINDOW
+            return 0
+
+    def _error_result(self, message, status, stream, headers=None):
+        if stream:
+            def gen_error():
+                err = {
+                    "error": {"message": message},
+                    "object": "error"
+                }
+                yield b"data: " + orjson.dumps(err) + b"\n\n"
+                yield b"data: [DONE]\n\n"
+            return gen_error, status, headers or {}
+        return {"error": message}, status, headers or {}
 
     def list_models(self):
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            r = requests.get(MODEL_LIST_ENDPOINT, headers=headers, timeout=15)
-            print(f"[AIEngine] Model list: {r.status_code} {r.text[:200]}")
+            r = SESSION.get(MODEL_LIST_ENDPOINT, headers=self.headers, timeout=(CONNECT_TIMEOUT, 15))
+            log.debug("[AIEngine] Model list: %s %r", r.status_code, r.content[:200])
             if r.status_code != 200:
                 return []
             model_data = r.json()
             return model_data.get("data", [])
         except Exception as e:
-            print(f"[AIEngine] Model listing exception: {e}")
+            log.error("[AIEngine] Model listing exception: %s", e)
             return []
 
     def relay_completion(self, payload, stream=False):
-        self._maybe_cooldown()
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        """Send payload to the provider; returns (result, status, headers), ready to return from a view.
+
+        result is a generator function for stream=True, otherwise the decoded JSON body.
+        """
+        retry_after = self._maybe_cooldown()
+        if retry_after:
+            # Reject instead of parking the worker thread until the window closes
+            log.warning("[AIEngine] cooldown active, rejecting request (%.1fs left)", retry_after)
+            seconds = math.ceil(retry_after)
+            return self._error_result(f"Rate limited, retry after {seconds}s", 429, stream,
+                                      {"Retry-After": str(seconds)})
         try:
             if stream:
-                with requests.post(self.chat_endpoint, headers=headers, json=payload, stream=True, timeout=80) as r:
-                    def gen():
-                        for line in r.iter_lines():
-                            if line:
-                                # Proper SSE chunk relay.
-                                text = line.decode()
-                                if not text.startswith("data: "):
-                                    text = "data: " + text
-                                yield text + "\n\n"
-                    return gen, r.status_code
+                r = with_backoff(lambda: SESSION.post(self.chat_endpoint, headers=self.stream_headers, json=payload, stream=True, timeout=(CONNECT_TIMEOUT, 80)))
+                def gen():
+                    # The response stays open until the relay is fully consumed.
+                    try:
+                        for line in iter_sse_lines(r):
+                            # Proper SSE chunk relay, framed as bytes without decoding.
+                            if line.startswith(SSE_PREFIX):
+                                yield line + SSE_SEP
+                            else:
+                                yield SSE_PREFIX + line + SSE_SEP
+                    finally:
+                        r.close()
+                return gen, r.status_code, {}
             else:
-                r = requests.post(self.chat_endpoint, headers=headers, json=payload, timeout=60)
-                print(f"[AIEngine][relay_completion] status: {r.status_code} body: {r.text[:200]}")
-                return r.json(), r.status_code
+                r = with_backoff(lambda: SESSION.post(self.chat_endpoint, headers=self.headers, json=payload, timeout=(CONNECT_TIMEOUT, 60)))
+                log.debug("[AIEngine][relay_completion] status: %s body: %r", r.status_code, r.content[:200])
+                return r.json(), r.status_code, {}
         except Exception as e:
-            print(f"[AIEngine] relay_completion exception: {e}")
-            if stream:
-                def gen_error():
-                    import json
-                    err = {
-                        "error": {"message": str(e)},
-                        "object": "error"
-                    }
-                    yield f"data: {json.dumps(err)}\n\n"
-                    yield "data: [DONE]\n\n"
-                return gen_error, 500
-            else:
-                return {"error": str(e)}, 500
+            log.error("[AIEngine] relay_completion exception: %s", e)
+            return self._error_result(str(e), 500, stream)
+
+def with_backoff(send):
+    """Call send() and retry transient provider failures with exponential backoff and jitter.
+
+    Connection failures (including connect timeouts) and retryable status codes are retried
+    up to AIEngine.MAX_RETRIES attempts, honouring Retry-After, without ever waiting more
+    than AIEngine.COOLDOWN_SECONDS in total. A read timeout means the provider already has
+    the request, so it is raised rather than sent (and billed) again.
+    """
+    waited = 0
+    for attempt in range(AIEngine.MAX_RETRIES):
+        try:
+            r, error = send(), None
+        except requests.exceptions.ConnectionError as e:  # also covers ConnectTimeout
+            r, error = None, e
+        if r is not None and r.status_code not in RETRY_STATUS_CODES:
+            return r
+
+        delay = min(AIEngine.BASE_BACKOFF * 2 ** attempt + random.random(), MAX_BACKOFF_SECONDS)
+        retry_after = r.headers.get("Retry-After", "") if r is not None else ""
+        if retry_after.isdigit():
+            delay = int(retry_after)
+        if attempt == AIEngine.MAX_RETRIES - 1 or waited + delay > AIEngine.COOLDOWN_SECONDS:
+            if error is not None:
+                raise error
+            return r
+
+        log.warning("[AIEngine] Retrying in %.1fs after %s", delay, error or r.status_code)
+        if r is not None:
+            r.close()
+        time.sleep(delay)
+        waited += delay
 
 engine = AIEngine(A4F_API_KEY, CHAT_COMPLETION_ENDPOINT)
 
+MODELS_CACHE = ModelsCache(ttl=60)
+
+def invalidate_models_on_auth_error(status_code):
+    """Drop the cached model list when the provider rejects the key; it was listed under the old one."""
+    if status_code in (401, 403):
+        MODELS_CACHE.invalidate()
+
+app.json = OrjsonProvider(app)
+
 @app.after_request
 def add_headers(response):
     response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -102,12 +215,17 @@ def add_headers(response):
 
 @app.route('/api/version', methods=['GET'])
 def version():
-    print("[API] GET /api/version")
+    log.debug("[API] GET /api/version")
     return jsonify({"version": "1.0.0"})
 
 @app.route('/api/tags', methods=['GET'])
 def tags():
-    print("[API] GET /api/tags")
+    log.debug("[API] GET /api/tags")
+    # Copilot polls this endpoint; serve the serialized list until it expires
+    body = MODELS_CACHE.get()
+    if body is not None:
+        return Response(body, mimetype="application/json")
+
     models = engine.list_models()
     formatted = []
     for m in models:
@@ -117,13 +235,13 @@ def tags():
             "modified_at": m.get("created", "2025-08-01T00:00:00Z"),
             "size": m.get("size", 0)
         })
-    return jsonify({"models": formatted})
+    return Response(MODELS_CACHE.store(formatted), mimetype="application/json")
 
 @app.route('/api/show', methods=['POST'])
 def show():
-    req = request.get_json(force=True)
+    req = read_json_body()
     model = req.get("model", "")
-    print(f"[API] POST /api/show: {model}")
+    log.debug("[API] POST /api/show: %s", model)
     return jsonify({
         "template": model,
         "capabilities": ["tools", "function_call"],
@@ -135,315 +253,224 @@ def show():
         }
     })
 
-def strip_text_values(data):
-    """Recursively replaces all string values in a JSON object with an empty string."""
-    if isinstance(data, dict):
-        return {key: strip_text_values(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [strip_text_values(item) for item in data]
-    elif isinstance(data, str):
-        return ""  # Replace string with empty
+def sse_error(message, model, created):
+    """Build a complete SSE error body: one chunk carrying the message, then [DONE]."""
+    prefix = sse_prefix({"id": f"error-{created}", "object": "chat.completion.chunk", "created": created, "model": model})
+    return sse_chunk(prefix, {"content": message}, "error") + b"data: [DONE]\n\n"
+
+def fake_stream(response_data, model, include_usage, created):
+    """Replay a complete (non-streaming) provider response as a sequence of SSE chunks.
+
+    created is the request timestamp, used wherever the provider response lacks one.
+    """
+    resp_id = f"chatcmpl-{created}"
+    prefix = sse_prefix({
+        "id": response_data.get("id", resp_id),
+        "object": "chat.completion.chunk",
+        "created": response_data.get("created", created),
+        "model": response_data.get("model", model),
+    })
+
+    choices = response_data.get("choices")
+    if not choices:
+        log.warning("[API] No choices in response - creating default response")
+        yield sse_chunk(prefix, {
+            "role": "assistant",
+            "content": "I apologize, but I'm unable to provide a response at this moment. Please try again."
+        }, "stop")
     else:
-        return data  # Keep numbers, booleans, etc.
-    
+        choice = choices[0]
+        message = choice.get("message") or {}
+        content = message.get("content") or choice.get("text", "")
+        tool_calls = message.get("tool_calls")
+
+        # Send role first if we have content or tool calls
+        if content or tool_calls:
+            yield sse_chunk(prefix, {"role": "assistant"})
+        if content:
+            yield sse_chunk(prefix, {"content": content})
+        if tool_calls:
+            yield sse_chunk(prefix, {"tool_calls": tool_calls})
+
+    # Final chunk with finish_reason
+    yield sse_chunk(prefix, {}, "stop")
+
+    # Send usage information if requested
+    if include_usage:
+        usage_chunk = {
+            "id": f"{resp_id}-usage",
+            "object": "chat.completion.chunk.usage",
+            "created": created,
+            "model": model,
+            "usage": response_data.get("usage", {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0
+            })
+        }
+        yield b"data: " + orjson.dumps(usage_chunk) + b"\n\n"
+
+    yield b"data: [DONE]\n\n"
+
 @app.route('/v1/chat/completions', methods=['POST'])
 def chat_completions():
-    req = request.get_json(force=True)
-    
-    # Create a text-free version of the request for structural analysis
-    # req_structure = strip_text_values(req)
+    req = read_json_body()
+    # One timestamp per request, shared by every chunk generated below
+    now = int(time.time())
+    resp_id = f"chatcmpl-{now}"
     
-    # print("[API] POST /v1/chat/completions (Structure Only):")
-    # print(json.dumps(req_structure))
+    # Log the request's top-level structure without the conversation text: only name each field's
+    # type, and only when DEBUG is on
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("[API] POST /v1/chat/completions (Structure Only): %s",
+                  {key: type(value).__name__ for key, value in req.items()})
     
-    # Validate request
-    if not req.get("model"):
+    # Validate request; setdefault covers the usual present/absent cases in one call,
+    # the follow-up assignment only runs for explicit empty or null values
+    if not req.setdefault("model", "gpt-4"):
         req["model"] = "gpt-4" # Fallback model if none provided
     
     # Make sure messages have valid roles
     for msg in req.get("messages", []):
-        if not msg.get("role"):
+        if not msg.setdefault("role", "user"):
             msg["role"] = "user"
     
-    headers = {
-        "Authorization": f"Bearer {A4F_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    # Read before the provider request is adjusted below
+    include_usage = req.get("stream_options", {}).get("include_usage", False)
 
     # Check if tools are present - if so, disable streaming in the outgoing request
     has_tools = bool(req.get("tools"))
     if has_tools:
-        print("[API] Tools detected - disabling streaming for provider request")
-        # Create a copy of the request without streaming
-        provider_req = req.copy()
-        provider_req["stream"] = False
-        if "stream_options" in provider_req:
-            del provider_req["stream_options"]
+        log.debug("[API] Tools detected - disabling streaming for provider request")
+        # The body was parsed for this request only, so adjust it in place rather than copying it
+        req["stream"] = False
+        req.pop("stream_options", None)
         use_streaming = False
     else:
-        provider_req = req
         use_streaming = req.get("stream", False)
+    provider_req = req
 
     # Make request to provider:
     try:
         if use_streaming:
             # True streaming mode (no tools)
-            with requests.post(
+            r = with_backoff(lambda: SESSION.post(
                 CHAT_COMPLETION_ENDPOINT,
-                headers=headers,
+                headers=engine.stream_headers,
                 json=provider_req,
-                timeout=60,
+                timeout=(CONNECT_TIMEOUT, 60),
                 stream=True
-            ) as r:
-                if r.status_code != 200:
-                    print(f"[API] Provider API Error: {r.status_code} - {r.text}")
-                    def error_stream():
-                        err = {"error": f"Provider API Error: {r.status_code}", "details": r.text}
-                        yield f"data: {json.dumps(err)}\n\n"
-                        yield "data: [DONE]\n\n"
-                    return Response(stream_with_context(error_stream()), mimetype="text/event-stream"), r.status_code
-                
-                def stream_response():
-                    print("[API] Starting to stream response from provider")
-                    for line in r.iter_lines():
-                        if not line:
-                            continue
-                            
-                        text = line.decode()
-                        if text.strip() == "data: [DONE]":
-                            yield text + "\n\n"
-                            print("[API] Completed streaming response")
+            ))
+            if r.status_code != 200:
+                log.error("[API] Provider API Error: %s - %s", r.status_code, r.text)
+                invalidate_models_on_auth_error(r.status_code)
+                r.close()
+                body = sse_error(f"Error: Provider API Error {r.status_code}", req["model"], now)
+                return Response(body, mimetype="text/event-stream"), r.status_code
+
+            def stream_response():
+                log.debug("[API] Starting to stream response from provider")
+                model = req.get("model") or "provider-model"
+                try:
+                    for line in iter_sse_lines(r):
+                        if line.strip() == b"data: [DONE]":
+                            log.debug("[API] Completed streaming response")
                             break
-                            
+
                         # Ensure proper SSE formatting
-                        if not text.startswith("data:"):
-                            text = "data: " + text
-                        
+                        if not line.startswith(b"data:"):
+                            line = b"data: " + line
+
+                        # Well-formed chunks need no patching, so skip the decode/encode round-trip
+                        if all(key in line for key in REQUIRED_CHUNK_KEYS):
+                            yield line + b"\n\n"
+                            continue
+
                         # Process the chunk to match expected format
                         try:
-                            if text.startswith("data:"):
-                                data = text[5:].strip()
-                                chunk = json.loads(data)
-                                
-                                # Add any missing required fields
-                                if "id" not in chunk:
-                                    chunk["id"] = f"chatcmpl-{int(time.time())}"
-                                if "object" not in chunk:
-                                    chunk["object"] = "chat.completion.chunk"
-                                if "created" not in chunk:
-                                    chunk["created"] = int(time.time())
-                                if "model" not in chunk:
-                                    chunk["model"] = req.get("model") or "provider-model"
-                                    
-                                # Make sure it has proper choices format
-                                if "choices" in chunk and chunk["choices"]:
-                                    # Ensure it has required fields
-                                    if "finish_reason" not in chunk["choices"][0]:
-                                        chunk["choices"][0]["finish_reason"] = None
-                                    if "index" not in chunk["choices"][0]:
-                                        chunk["choices"][0]["index"] = 0
-                                
-                                # Reconstruct the formatted chunk
-                                text = f"data: {json.dumps(chunk)}\n\n"
+                            chunk = orjson.loads(line[5:])
+
+                            # Add any missing required fields
+                            if "id" not in chunk:
+                                chunk["id"] = resp_id
+                            if "object" not in chunk:
+                                chunk["object"] = "chat.completion.chunk"
+                            if "created" not in chunk:
+                                chunk["created"] = now
+                            if "model" not in chunk:
+                                chunk["model"] = model
+
+                            # Make sure it has proper choices format
+                            if "choices" in chunk and chunk["choices"]:
+                                # Ensure it has required fields
+                                if "finish_reason" not in chunk["choices"][0]:
+                                    chunk["choices"][0]["finish_reason"] = None
+                                if "index" not in chunk["choices"][0]:
+                                    chunk["choices"][0]["index"] = 0
+
+                            # Reconstruct the formatted chunk
+                            line = b"data: " + orjson.dumps(chunk)
                         except Exception as e:
-                            print(f"[API] Warning: Error processing chunk: {e}")
-                        
-                        yield text
-                    
-                    # Send any usage information at the end if requested
-                    if req.get("stream_options", {}).get("include_usage", False):
-                        usage_chunk = {
-                            "id": f"chatcmpl-usage-{int(time.time())}",
-                            "object": "chat.completion.chunk.usage",
-                            "created": int(time.time()),
-                            "model": req.get("model") or "provider-model",
-                            "usage": {
-                                "prompt_tokens": 0,  # These would ideally be real values
-                                "completion_tokens": 0,
-                                "total_tokens": 0
-                            }
+                            log.warning("[API] Error processing chunk: %s", e)
+
+                        yield line + b"\n\n"
+                finally:
+                    r.close()
+
+                # Send any usage information at the end if requested
+                if include_usage:
+                    usage_chunk = {
+                        "id": f"{resp_id}-usage",
+                        "object": "chat.completion.chunk.usage",
+                        "created": now,
+                        "model": req.get("model") or "provider-model",
+                        "usage": {
+                            "prompt_tokens": 0,  # These would ideally be real values
+                            "completion_tokens": 0,
+                            "total_tokens": 0
                         }
-                        yield f"data: {json.dumps(usage_chunk)}\n\n"
-                    
-                    yield "data: [DONE]\n\n"
+                    }
+                    yield b"data: " + orjson.dumps(usage_chunk) + b"\n\n"
+
+                yield b"data: [DONE]\n\n"
+
+            log.debug("[API] Returning SSE streaming to Copilot.")
+            return Response(stream_with_context(stream_response()), mimetype="text/event-stream")
 
-                print("[API] Returning SSE streaming to Copilot.")
-                return Response(stream_with_context(stream_response()), mimetype="text/event-stream")
-        
         else:
             # Non-streaming mode or tools present - get complete response and fake stream it
-            print("[API] Using non-streaming mode (tools present or streaming disabled)")
-            r = requests.post(
+            log.debug("[API] Using non-streaming mode (tools present or streaming disabled)")
+            r = with_backoff(lambda: SESSION.post(
                 CHAT_COMPLETION_ENDPOINT,
-                headers=headers,
+                headers=engine.headers,
                 json=provider_req,
-                timeout=60
-            )
+                timeout=(CONNECT_TIMEOUT, 60)
+            ))
             
             if r.status_code != 200:
-                print(f"[API] Provider API Error: {r.status_code} - {r.text}")
-                def error_stream():
-                    error_response = {
-                        "id": f"error-{int(time.time())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": req.get("model", "provider-model"),
-                        "choices": [{
-                            "index": 0,
-                            "delta": {
-                                "content": f"Error: Provider API Error {r.status_code}"
-                            },
-                            "finish_reason": "error"
-                        }]
-                    }
-                    yield f"data: {json.dumps(error_response)}\n\n"
-                    yield "data: [DONE]\n\n"
-                return Response(stream_with_context(error_stream()), mimetype="text/event-stream"), r.status_code
+                log.error("[API] Provider API Error: %s - %s", r.status_code, r.text)
+                invalidate_models_on_auth_error(r.status_code)
+                body = sse_error(f"Error: Provider API Error {r.status_code}", req["model"], now)
+                return Response(body, mimetype="text/event-stream"), r.status_code
             
             # Process the complete response
             try:
                 response_data = r.json()
-                print(f"[API] Received complete response: {json.dumps(response_data, indent=2)[:500]}...")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("[API] Received complete response: %s...", json.dumps(response_data, indent=2)[:500])
             except:
-                print(f"[API] Failed to parse JSON response: {r.text[:200]}")
+                log.warning("[API] Failed to parse JSON response: %r", r.content[:200])
                 response_data = {"choices": []}
                 
-            # Convert complete response to streaming format
-            def fake_stream_response():
-                # Check if we have valid choices
-                if not response_data.get("choices") or len(response_data["choices"]) == 0:
-                    print("[API] No choices in response - creating default response")
-                    # Create a default response if no choices
-                    default_response = {
-                        "id": f"chatcmpl-{int(time.time())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": req.get("model", "provider-model"),
-                        "choices": [{
-                            "index": 0,
-                            "delta": {
-                                "role": "assistant",
-                                "content": "I apologize, but I'm unable to provide a response at this moment. Please try again."
-                            },
-                            "finish_reason": "stop"
-                        }]
-                    }
-                    yield f"data: {json.dumps(default_response)}\n\n"
-                else:
-                    choice = response_data["choices"][0]
-                    content = ""
-                    
-                    # Extract content from the response
-                    if "message" in choice and choice["message"].get("content"):
-                        content = choice["message"]["content"]
-                    elif "text" in choice:
-                        content = choice["text"]
-                    
-                    # Handle tool calls if present
-                    tool_calls = None
-                    if "message" in choice and choice["message"].get("tool_calls"):
-                        tool_calls = choice["message"]["tool_calls"]
-                    
-                    # Send role first if we have content or tool calls
-                    if content or tool_calls:
-                        role_chunk = {
-                            "id": response_data.get("id", f"chatcmpl-{int(time.time())}"),
-                            "object": "chat.completion.chunk",
-                            "created": response_data.get("created", int(time.time())),
-                            "model": response_data.get("model", req.get("model", "provider-model")),
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"role": "assistant"},
-                                "finish_reason": None
-                            }]
-                        }
-                        yield f"data: {json.dumps(role_chunk)}\n\n"
-                    
-                    # Send content if available
-                    if content:
-                        content_chunk = {
-                            "id": response_data.get("id", f"chatcmpl-{int(time.time())}"),
-                            "object": "chat.completion.chunk",
-                            "created": response_data.get("created", int(time.time())),
-                            "model": response_data.get("model", req.get("model", "provider-model")),
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"content": content},
-                                "finish_reason": None
-                            }]
-                        }
-                        yield f"data: {json.dumps(content_chunk)}\n\n"
-                    
-                    # Send tool calls if available
-                    if tool_calls:
-                        tool_chunk = {
-                            "id": response_data.get("id", f"chatcmpl-{int(time.time())}"),
-                            "object": "chat.completion.chunk",
-                            "created": response_data.get("created", int(time.time())),
-                            "model": response_data.get("model", req.get("model", "provider-model")),
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"tool_calls": tool_calls},
-                                "finish_reason": None
-                            }]
-                        }
-                        yield f"data: {json.dumps(tool_chunk)}\n\n"
-                
-                # Final chunk with finish_reason
-                final_chunk = {
-                    "id": response_data.get("id", f"chatcmpl-{int(time.time())}"),
-                    "object": "chat.completion.chunk",
-                    "created": response_data.get("created", int(time.time())),
-                    "model": response_data.get("model", req.get("model", "provider-model")),
-                    "choices": [{
-                        "index": 0,
-                        "delta": {},
-                        "finish_reason": "stop"
-                    }]
-                }
-                yield f"data: {json.dumps(final_chunk)}\n\n"
-                
-                # Send usage information if requested
-                if req.get("stream_options", {}).get("include_usage", False):
-                    usage_data = response_data.get("usage", {
-                        "prompt_tokens": 0,
-                        "completion_tokens": 0,
-                        "total_tokens": 0
-                    })
-                    usage_chunk = {
-                        "id": f"chatcmpl-usage-{int(time.time())}",
-                        "object": "chat.completion.chunk.usage",
-                        "created": int(time.time()),
-                        "model": req.get("model") or "provider-model",
-                        "usage": usage_data
-                    }
-                    yield f"data: {json.dumps(usage_chunk)}\n\n"
-                
-                yield "data: [DONE]\n\n"
-            
-            print("[API] Returning fake SSE streaming to Copilot.")
-            return Response(stream_with_context(fake_stream_response()), mimetype="text/event-stream")
+            log.debug("[API] Returning fake SSE streaming to Copilot.")
+            model = req.get("model") or "provider-model"
+            return Response(stream_with_context(fake_stream(response_data, model, include_usage, now)), mimetype="text/event-stream")
 
     except Exception as e:
-        print(f"[API] Exception forwarding request: {e}")
-        def error_stream():
-            # Format error as a proper OpenAI-compatible error response
-            error_response = {
-                "id": f"error-{int(time.time())}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": req.get("model", "provider-model"),
-                "choices": [{
-                    "index": 0,
-                    "delta": {
-                        "content": f"Error: {str(e)}"
-                    },
-                    "finish_reason": "error"
-                }]
-            }
-            yield f"data: {json.dumps(error_response)}\n\n"
-            yield "data: [DONE]\n\n"
-        return Response(stream_with_context(error_stream()), mimetype="text/event-stream"), 500
+        log.error("[API] Exception forwarding request: %s", e)
+        # Format error as a proper OpenAI-compatible error response
+        body = sse_error(f"Error: {e}", req["model"], now)
+        return Response(body, mimetype="text/event-stream"), 500
 
 
 
@@ -451,9 +478,10 @@ def chat_completions():
 @app.route("/", defaults={"path": ""}, methods=["GET", "POST"])
 @app.route("/<path:path>", methods=["GET", "POST"])
 def catch_all(path):
-    print(f"[API] WARNING: Hit unknown endpoint: {request.method} /{path}")
+    log.warning("[API] Hit unknown endpoint: %s /%s", request.method, path)
     return jsonify({"error": "Not implemented"}), 404
 
 if __name__ == '__main__':
-    print("== Custom AI Backend Server for Copilot BYOK starting on localhost:11434 ==")
-    app.run(host="localhost", port=11434)
+    log.info("== Custom AI Backend Server for Copilot BYOK starting on localhost:11434 ==")
+    # Development server only; see the README for running under gunicorn
+    app.run(host="localhost", port=11434, threaded=True)
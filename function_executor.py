@@ -1,43 +1,216 @@
 import re
 import json
+import orjson
+import copy
+import functools
+import logging
+import mmap
 import subprocess
 import os
+import stat
 import tempfile
 import time
 
+# Parser diagnostics; the host application decides where (and whether) they go
+log = logging.getLogger("parser")
+log.addHandler(logging.NullHandler())
+
+# Precompiled patterns shared by the parsers below
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_INVOKE_RE = re.compile(r'<invoke name="([^"]+)">(.*?)</invoke>', re.DOTALL)
+_PARAM_RE = re.compile(r'<parameter name="([^"]+)">([^<]*)</parameter>')
+_TOOL_CALL_RE = re.compile(r'\{"name":\s*"([^"]+)",\s*"arguments":\s*(\{.*?\})\}', re.DOTALL)
+_JSON_BLOCK_RE = re.compile(r'```json\s*\n(.*?)\n```', re.DOTALL)
+_CODE_BLOCK_RE = re.compile(r'```(?:python|py)?\n(.*?)```', re.DOTALL)
+_FILE_CREATION_RE = re.compile(r'create.*?file.*?["\']([^"\']+)["\']', re.IGNORECASE)
+_FILE_PATH_ARG_RE = re.compile(r'"filePath":\s*"([^"]+)"')
+_EXPLANATION_ARG_RE = re.compile(r'"explanation":\s*"([^"]+)"')
+_CODE_ARG_RE = re.compile(r'"code":\s*"([^"]+(?:\\.[^"]*)*)"')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_DEF_NAME_RE = re.compile(r'def\s+(\w+)')
+# Everything clean_content_for_display strips, as one alternation so the text is scanned once
+_CLEAN_RE = re.compile(
+    r'<(?:think>.*?</think>|invoke name="[^"]+">.*?</invoke>)'
+    r'|\{"name":\s*"[^"]+",\s*"arguments":\s*\{[^}]*\}\}'
+    r'|```json\s*\n.*?\n```',
+    re.DOTALL,
+)
+_JSON_DECODER = json.JSONDecoder()
+_CLEAN_CLOSERS = ('</think>', '}}', '\n```', '</invoke>')
+# insert_edit_into_file searches files larger than this through mmap instead of reading them
+_MMAP_MIN_SIZE = 64 * 1024
+
+def _read_text(file_path):
+    """Read a UTF-8 file with one bulk decode, translating newlines like text mode does"""
+    with open(file_path, 'rb') as f:
+        content = f.read().decode('utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+def _encode_text(content):
+    """Encode content as UTF-8 in one call, translating newlines like text mode does"""
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    return content.encode('utf-8')
+
+def _write_text(file_path, content, mode='wb'):
+    """Write content as UTF-8 with one bulk encode (see _write_bytes)"""
+    _write_bytes(file_path, _encode_text(content), mode)
+
+def _write_bytes(file_path, data, mode='wb'):
+    """Write data to file_path.
+
+    Overwrites of an existing file go through a temp file next to its resolved path and os.replace(),
+    so a crash mid-write leaves either the old or the new contents, never a truncated file. The mode,
+    owner and group carry over and symlinks keep pointing at the updated file. When the directory
+    isn't writable or the owner can't be copied, the file is overwritten in place instead.
+    """
+    if mode != 'wb' or not os.path.exists(file_path):
+        with open(file_path, mode) as f:
+            f.write(data)
+        return
+    file_path = os.path.realpath(file_path)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))
+    except PermissionError:
+        fd = None
+    if fd is not None:
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                tmp_stat = os.fstat(f.fileno())
+            file_stat = os.stat(file_path)
+            os.chmod(tmp_path, stat.S_IMODE(file_stat.st_mode))
+            if (tmp_stat.st_uid, tmp_stat.st_gid) != (file_stat.st_uid, file_stat.st_gid):
+                os.chown(tmp_path, file_stat.st_uid, file_stat.st_gid)
+            os.replace(tmp_path, file_path)
+            return
+        except PermissionError:
+            os.unlink(tmp_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    with open(file_path, 'wb') as f:
+        f.write(data)
+
+@functools.lru_cache(maxsize=256)
+def _func_def_re(func_name):
+    """Compiled pattern for a function definition: the signature line plus every following line
+    up to the next def/class or trailing whitespace, matched line by line. ASCII-only \\s, so it
+    matches the same text as the bytes version below"""
+    return re.compile(rf'def\s+{re.escape(func_name)}\s*\([^)]*\):[^\n]*(?:\n(?!\s*(?:def|class)|\s*\Z)[^\n]*)*', re.ASCII)
+
+@functools.lru_cache(maxsize=256)
+def _func_def_bytes_re(func_name):
+    """_func_def_re for searching raw file bytes"""
+    return re.compile(_func_def_re(func_name).pattern.encode('utf-8'))
+
+def _replace_function(file_path, func_name, code):
+    """Replace the definition of func_name in file_path with code; False if it isn't defined there.
+
+    Files above _MMAP_MIN_SIZE are searched through a read-only mmap with the bytes pattern, so
+    the file is never decoded into a str and only the spliced result is built in memory. That is
+    only done when the text path would write the same bytes: no CRs for _read_text to translate
+    and no newline translation on write.
+    """
+    if os.linesep == '\n' and os.path.getsize(file_path) > _MMAP_MIN_SIZE:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            raw = mm.find(b'\r') < 0
+            if raw:
+                match = _func_def_bytes_re(func_name).search(mm)
+                if match:
+                    data = mm[:match.start()] + _encode_text(code) + mm[match.end():]
+        if raw:
+            if not match:
+                return False
+            _write_bytes(file_path, data)
+            return True
+    
+    existing_content = _read_text(file_path)
+    match = _func_def_re(func_name).search(existing_content)
+    if not match:
+        return False
+    _write_text(file_path, existing_content[:match.start()] + code + existing_content[match.end():])
+    return True
+
+def _match_end(content, closer):
+    """Return the index just past the last occurrence of closer in content (0 if absent).
+
+    Every match of the lazy '<open>.*?<close>' patterns above ends with its closer, so nothing
+    can match beyond this point. Passing it as endpos stops an opener that is never closed from
+    rescanning to the end of the string, which is quadratic when a response has many of them.
+    """
+    end = content.rfind(closer)
+    return end + len(closer) if end >= 0 else 0
+
+def _sub_until(pattern, repl, content, closer):
+    """pattern.sub() restricted to the region that can contain a match (see _match_end)"""
+    end = _match_end(content, closer)
+    if not end:
+        return content
+    return pattern.sub(repl, content[:end]) + content[end:]
+
+def _has_call_markers(content):
+    """Every call format needs an <invoke> element or a <tool_call> marker; plain replies skip the regexes.
+
+    Missing or non-text content (e.g. a null content field on a tool-call-only reply) has no calls.
+    """
+    return isinstance(content, str) and ('<invoke' in content or '<tool_call>' in content)
+
+def _strip_think(content):
+    """Remove <think> blocks to ignore reasoning"""
+    return _sub_until(_THINK_RE, '', content, '</think>').strip()
+
 def parse_function_calls_from_text(content):
     """Parse function calls from text content for models that don't support native function calling"""
+    if not _has_call_markers(content):
+        return []
+    return _parse_function_calls(_strip_think(content))
+
+def parse_and_clean_content(content):
+    """Parse function calls and, if there are any, the display text, stripping <think> blocks once.
+
+    Returns (function_calls, cleaned_content). Same result as parse_function_calls_from_text followed
+    by clean_content_for_display when calls were found; content is returned as-is otherwise.
+    Results are memoized per content string (repeated and cached completions parse once); the calls
+    are deep-copied on the way out because callers own, and may modify, what they get back.
+    """
+    function_calls, cleaned_content = _parse_and_clean_cached(content)
+    return copy.deepcopy(function_calls), cleaned_content
+
+@functools.lru_cache(maxsize=128)
+def _parse_and_clean_cached(content):
+    if not _has_call_markers(content):
+        return [], content
+    stripped = _strip_think(content)
+    function_calls = _parse_function_calls(stripped)
+    if not function_calls:
+        return function_calls, content
+    return function_calls, clean_content_for_display(stripped)
+
+def _parse_function_calls(content):
+    """parse_function_calls_from_text on content whose <think> blocks are already removed"""
     function_calls = []
     
     try:
-        # Remove <think> blocks to ignore reasoning
-        content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
-        
         # Check if this is a reasoning model response with <think> tags
         is_reasoning_model = '<tool_call>' in content
         
         if is_reasoning_model:
-            print("[PARSER] Detected reasoning model response")
+            log.debug("Detected reasoning model response")
             # Handle reasoning model format
             function_calls.extend(parse_reasoning_model_calls(content))
         
         # Standard XML format: <invoke name="tool_name">...<parameter>...
-        invoke_pattern = r'<invoke name="([^"]+)">(.*?)</invoke>'
-        matches = re.finditer(invoke_pattern, content, re.DOTALL)
+        matches = _INVOKE_RE.finditer(content, 0, _match_end(content, '</invoke>'))
         
         for match in matches:
             func_name = match.group(1)
             params_text = match.group(2)
             
             # Parse parameters
-            params = {}
-            param_pattern = r'<parameter name="([^"]+)">([^<]*)</parameter>'
-            param_matches = re.finditer(param_pattern, params_text)
-            
-            for param_match in param_matches:
-                param_name = param_match.group(1)
-                param_value = param_match.group(2).strip()
-                params[param_name] = param_value
+            params = {name: value.strip() for name, value in _PARAM_RE.findall(params_text)}
             
             function_calls.append({
                 "name": func_name,
@@ -45,63 +218,91 @@ def parse_function_calls_from_text(content):
             })
             
     except Exception as e:
-        print(f"[PARSER] Error parsing function calls: {e}")
+        log.warning("Error parsing function calls: %s", e)
     
     return function_calls
 
+def _iter_tool_call_json(content):
+    """Yield (name, arguments, None) for each {"name": ..., "arguments": {...}} object in content.
+
+    Objects are decoded in place with raw_decode, so nested braces and string escapes are handled
+    by the json module. When an object does not decode, the old regex is tried at that position and
+    (name, None, args_text) is yielded so the caller can fall back to unescaping the raw text.
+    """
+    if '"arguments"' not in content:
+        return
+    endpos = _match_end(content, '}}')
+    pos = content.find('{"name"')
+    while pos >= 0:
+        end = pos + 1
+        try:
+            obj, end = _JSON_DECODER.raw_decode(content, pos)
+        except json.JSONDecodeError:
+            obj = None
+        if isinstance(obj, dict) and isinstance(obj.get("name"), str) and isinstance(obj.get("arguments"), dict):
+            yield obj["name"], obj["arguments"], None
+        else:
+            match = _TOOL_CALL_RE.match(content, pos, endpos)
+            if match:
+                yield match.group(1), None, match.group(2)
+                end = match.end()
+        pos = content.find('{"name"', end)
+
 def parse_reasoning_model_calls(content):
     """Parse function calls from reasoning models that use different formats"""
     function_calls = []
     
     try:
         # Pattern 1: {"name": "tool_name", "arguments": {...}} - handle complex nested JSON
-        tool_call_pattern = r'\{"name":\s*"([^"]+)",\s*"arguments":\s*(\{.*?\})\}'
-        matches = re.finditer(tool_call_pattern, content, re.DOTALL)
+        for func_name, params, args_text in _iter_tool_call_json(content):
+            if params is None:
+                # Regex fallback for calls the decoder rejected (e.g. over-escaped arguments)
+                try:
+                    # Handle escaped quotes and newlines in the JSON
+                    args_text = args_text.replace('\\"', '"').replace('\\n', '\n').replace('\\\\', '\\')
+                    params = orjson.loads(args_text)
+                except orjson.JSONDecodeError as e:
+                    log.warning("Failed to parse JSON arguments for %s: %s", func_name, e)
+                    # Try manual parameter extraction
+                    params = extract_parameters_manually(args_text)
+                    if params:
+                        func_name = map_tool_name(func_name)
+                        function_calls.append({
+                            "name": func_name,
+                            "parameters": params
+                        })
+                        log.debug("Manually extracted parameters for %s", func_name)
+                    continue
+            
+            # Map non-existent tools to real ones
+            func_name = map_tool_name(func_name)
+            
+            function_calls.append({
+                "name": func_name,
+                "parameters": params
+            })
+            log.debug("Successfully parsed %s with %d parameters", func_name, len(params))
         
-        for match in matches:
-            func_name = match.group(1)
-            try:
-                args_text = match.group(2)
-                
-                # Handle escaped quotes and newlines in the JSON
-                args_text = args_text.replace('\\"', '"').replace('\\n', '\n').replace('\\\\', '\\')
-                
-                # Try to parse as JSON
-                params = json.loads(args_text)
-                
-                # Map non-existent tools to real ones
-                func_name = map_tool_name(func_name)
-                
-                function_calls.append({
-                    "name": func_name,
-                    "parameters": params
-                })
-                print(f"[PARSER] Successfully parsed {func_name} with {len(params)} parameters")
-                
-            except json.JSONDecodeError as e:
-                print(f"[PARSER] Failed to parse JSON arguments for {func_name}: {e}")
-                # Try manual parameter extraction
-                params = extract_parameters_manually(args_text)
-                if params:
-                    func_name = map_tool_name(func_name)
-                    function_calls.append({
-                        "name": func_name,
-                        "parameters": params
-                    })
-                    print(f"[PARSER] Manually extracted parameters for {func_name}")
+        # The three patterns are alternative formats: stop at the first one that yields calls,
+        # so a response carrying both a tool-call JSON and a code block isn't executed twice
+        if function_calls:
+            return function_calls
         
         # Pattern 2: Look for code blocks that suggest file operations
-        if not function_calls:
-            function_calls.extend(extract_implicit_function_calls(content))
+        function_calls.extend(extract_implicit_function_calls(content))
+        if function_calls:
+            return function_calls
         
         # Pattern 3: JSON tool calls in code blocks
-        code_block_pattern = r'```json\s*\n(.*?)\n```'
-        code_matches = re.finditer(code_block_pattern, content, re.DOTALL)
+        if '```json' in content:
+            code_matches = _JSON_BLOCK_RE.finditer(content, 0, _match_end(content, '\n```'))
+        else:
+            code_matches = ()
         
         for match in code_matches:
             json_text = match.group(1).strip()
             try:
-                tool_call = json.loads(json_text)
+                tool_call = orjson.loads(json_text)
                 if "tool" in tool_call:
                     func_name = tool_call["tool"]
                     params = {k: v for k, v in tool_call.items() if k != "tool"}
@@ -110,12 +311,12 @@ def parse_reasoning_model_calls(content):
                         "name": func_name,
                         "parameters": params
                     })
-                    print(f"[PARSER] Parsed tool call from code block: {func_name}")
-            except json.JSONDecodeError as e:
-                print(f"[PARSER] Failed to parse JSON from code block: {e}")
+                    log.debug("Parsed tool call from code block: %s", func_name)
+            except orjson.JSONDecodeError as e:
+                log.warning("Failed to parse JSON from code block: %s", e)
             
     except Exception as e:
-        print(f"[PARSER] Error parsing reasoning model calls: {e}")
+        log.warning("Error parsing reasoning model calls: %s", e)
     
     return function_calls
 
@@ -125,17 +326,17 @@ def extract_parameters_manually(args_text):
     
     try:
         # Extract filePath
-        file_path_match = re.search(r'"filePath":\s*"([^"]+)"', args_text)
+        file_path_match = _FILE_PATH_ARG_RE.search(args_text)
         if file_path_match:
             params["filePath"] = file_path_match.group(1)
         
         # Extract explanation
-        explanation_match = re.search(r'"explanation":\s*"([^"]+)"', args_text)
+        explanation_match = _EXPLANATION_ARG_RE.search(args_text)
         if explanation_match:
             params["explanation"] = explanation_match.group(1)
         
         # Extract code (this is trickier due to escaping)
-        code_match = re.search(r'"code":\s*"([^"]+(?:\\.[^"]*)*)"', args_text)
+        code_match = _CODE_ARG_RE.search(args_text)
         if code_match:
             code = code_match.group(1)
             # Unescape the code
@@ -143,87 +344,71 @@ def extract_parameters_manually(args_text):
             params["code"] = code
         
     except Exception as e:
-        print(f"[PARSER] Error in manual parameter extraction: {e}")
+        log.warning("Error in manual parameter extraction: %s", e)
     
     return params
 
+# Tool names models invent, mapped to the executors below
+_TOOL_NAME_MAP = {
+    "edit_file": "replace_string_in_file",
+    "write_file": "create_file",
+    "save_file": "create_file",
+    "execute_command": "run_in_terminal",
+    "run_command": "run_in_terminal",
+    "terminal": "run_in_terminal"
+}
+
 def map_tool_name(tool_name):
     """Map non-existent tool names to real ones"""
-    tool_mapping = {
-        "edit_file": "replace_string_in_file",
-        "write_file": "create_file",
-        "save_file": "create_file",
-        "execute_command": "run_in_terminal",
-        "run_command": "run_in_terminal",
-        "terminal": "run_in_terminal"
-    }
-    
-    mapped_name = tool_mapping.get(tool_name, tool_name)
-    if mapped_name != tool_name:
-        print(f"[PARSER] Mapped {tool_name} -> {mapped_name}")
+    mapped_name = _TOOL_NAME_MAP.get(tool_name)
+    if mapped_name is None:
+        return tool_name
     
+    log.debug("Mapped %s -> %s", tool_name, mapped_name)
     return mapped_name
 
 def extract_implicit_function_calls(content):
     """Extract implicit function calls from reasoning model responses"""
     function_calls = []
     
-    # Look for file creation patterns
-    file_creation_pattern = r'create.*?file.*?["\']([^"\']+)["\']'
-    matches = re.finditer(file_creation_pattern, content, re.IGNORECASE)
+    # Every file creation pattern takes the first code block in the response as its content
+    code_block = _CODE_BLOCK_RE.search(content, 0, _match_end(content, '```'))
+    if not code_block:
+        return function_calls
+    code = code_block.group(1).strip()
     
-    for match in matches:
-        file_path = match.group(1)
-        # Look for code blocks near this pattern
-        code_blocks = re.findall(r'```(?:python|py)?\n(.*?)```', content, re.DOTALL)
-        if code_blocks:
-            function_calls.append({
-                "name": "create_file",
-                "parameters": {
-                    "filePath": file_path,
-                    "content": code_blocks[0].strip()
-                }
-            })
+    # Look for file creation patterns
+    for match in _FILE_CREATION_RE.finditer(content):
+        function_calls.append({
+            "name": "create_file",
+            "parameters": {
+                "filePath": match.group(1),
+                "content": code
+            }
+        })
     
     return function_calls
 
 def clean_content_for_display(content):
     """Clean reasoning model content for display to user"""
-    # Remove <think> tags and their content
-    content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
-    
-    # Remove tool call JSON
-    content = re.sub(r'\{"name":\s*"[^"]+",\s*"arguments":\s*\{[^}]*\}\}', '', content)
-    
-    # Remove code blocks with JSON
-    content = re.sub(r'```json\s*\n.*?\n```', '', content, flags=re.DOTALL)
-    
-    # Remove XML tool calls
-    content = re.sub(r'<invoke name="[^"]+">.*?</invoke>', '', content, flags=re.DOTALL)
+    # Remove <think> blocks, tool call JSON, JSON code blocks and XML tool calls in one pass
+    end = max(_match_end(content, closer) for closer in _CLEAN_CLOSERS)
+    if end:
+        content = _CLEAN_RE.sub('', content[:end]) + content[end:]
     
     # Clean up extra whitespace
-    content = re.sub(r'\n\s*\n', '\n\n', content)
+    content = _BLANK_LINES_RE.sub('\n\n', content)
     content = content.strip()
     
     return content
 
 def execute_function_call(func_name, params):
     """Execute the actual function call and return results"""
+    handler = _FUNCTION_HANDLERS.get(func_name)
+    if handler is None:
+        return {"error": f"Function {func_name} not supported"}
     try:
-        if func_name == "create_file":
-            return execute_create_file(params)
-        elif func_name == "run_in_terminal":
-            return execute_run_in_terminal(params)
-        elif func_name == "read_file":
-            return execute_read_file(params)
-        elif func_name == "replace_string_in_file":
-            return execute_replace_string_in_file(params)
-        elif func_name == "insert_edit_into_file":
-            return execute_insert_edit_into_file(params)
-        elif func_name == "list_dir":
-            return execute_list_dir(params)
-        else:
-            return {"error": f"Function {func_name} not supported"}
+        return handler(params)
     except Exception as e:
         return {"error": f"Error executing {func_name}: {str(e)}"}
 
@@ -237,36 +422,25 @@ def execute_insert_edit_into_file(params):
         return {"error": "filePath parameter required"}
     
     try:
-        # Read the existing file
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                existing_content = f.read()
-            
             # Find the function to replace based on the code pattern
             # This is a smart replacement - look for the function signature
-            lines = code.strip().split('\n')
-            if lines:
-                first_line = lines[0].strip()
-                if 'def ' in first_line:
-                    # Extract function name
-                    func_match = re.search(r'def\s+(\w+)', first_line)
-                    if func_match:
-                        func_name = func_match.group(1)
-                        
-                        # Find existing function in file
-                        pattern = rf'def\s+{func_name}\s*\([^)]*\):\s*.*?(?=\n\s*def|\n\s*class|\n\s*$|\Z)'
-                        match = re.search(pattern, existing_content, re.DOTALL)
-                        
-                        if match:
-                            # Replace existing function
-                            new_content = existing_content.replace(match.group(0), code.strip())
-                            with open(file_path, 'w', encoding='utf-8') as f:
-                                f.write(new_content)
-                            return {"success": f"Function {func_name} updated in {file_path}"}
+            # Only the first non-blank line is inspected, so slice it out instead of splitting the whole blob
+            start = len(code) - len(code.lstrip())
+            end = code.find('\n', start)
+            first_line = code[start:end if end >= 0 else len(code)].rstrip()
+            if 'def ' in first_line:
+                # Extract function name
+                func_match = _DEF_NAME_RE.search(first_line)
+                if func_match:
+                    func_name = func_match.group(1)
+                    
+                    # Find and replace the existing function in the file
+                    if _replace_function(file_path, func_name, code.strip()):
+                        return {"success": f"Function {func_name} updated in {file_path}"}
             
             # If no function found, append the code
-            with open(file_path, 'a', encoding='utf-8') as f:
-                f.write('\n\n' + code)
+            _write_text(file_path, '\n\n' + code, 'ab')
             return {"success": f"Code appended to {file_path}"}
         else:
             # Create new file
@@ -289,8 +463,7 @@ def execute_create_file(params):
         if dir_path and dir_path != "":
             os.makedirs(dir_path, exist_ok=True)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        _write_text(file_path, content)
         
         return {"success": f"File {file_path} created successfully"}
     except Exception as e:
@@ -300,7 +473,10 @@ def execute_run_in_terminal(params):
     """Run a command in terminal"""
     command = params.get("command")
     explanation = params.get("explanation", "")
-    is_background = params.get("isBackground", "false").lower() == "true"
+    # JSON-decoded arguments carry a real bool; XML <parameter> values arrive as "true"/"false"
+    is_background = params.get("isBackground", False)
+    if is_background is not True:
+        is_background = isinstance(is_background, str) and is_background.lower() == "true"
     
     if not command:
         return {"error": "command parameter required"}
@@ -333,8 +509,7 @@ def execute_read_file(params):
         return {"error": "filePath (or filename) parameter required"}
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = _read_text(file_path)
         return {"success": f"File {file_path} read successfully", "content": content}
     except Exception as e:
         return {"error": f"Failed to read file: {str(e)}"}
@@ -349,16 +524,16 @@ def execute_replace_string_in_file(params):
         return {"error": "filePath (or filename), oldString, and newString parameters required"}
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = _read_text(file_path)
         
-        if old_string not in content:
+        # One scan locates the edit; only that occurrence is replaced
+        index = content.find(old_string)
+        if index < 0:
             return {"error": "oldString not found in file"}
         
-        new_content = content.replace(old_string, new_string)
+        new_content = content[:index] + new_string + content[index + len(old_string):]
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        _write_text(file_path, new_content)
         
         return {"success": f"String replaced in {file_path}"}
     except Exception as e:
@@ -369,7 +544,28 @@ def execute_list_dir(params):
     path = params.get("path", ".")
     
     try:
-        items = os.listdir(path)
-        return {"success": f"Directory {path} listed", "items": items}
+        # scandir returns each entry's type with the name, so only regular files need a stat() for their size
+        items = []
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                is_file = entry.is_file(follow_symlinks=False)
+                items.append(entry.name)
+                entries.append({
+                    "name": entry.name,
+                    "is_dir": entry.is_dir(follow_symlinks=False),
+                    "size": entry.stat(follow_symlinks=False).st_size if is_file else None
+                })
+        return {"success": f"Directory {path} listed", "items": items, "entries": entries}
     except Exception as e:
-        return {"error": f"Failed to list directory: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Failed to list directory: {str(e)}"}
+
+# Tool name -> executor, used by execute_function_call
+_FUNCTION_HANDLERS = {
+    "create_file": execute_create_file,
+    "run_in_terminal": execute_run_in_terminal,
+    "read_file": execute_read_file,
+    "replace_string_in_file": execute_replace_string_in_file,
+    "insert_edit_into_file": execute_insert_edit_into_file,
+    "list_dir": execute_list_dir
+}
@@ -0,0 +1,76 @@
+import time
+from flask import request, abort
+from flask.json.provider import DefaultJSONProvider
+import orjson
+
+# Helpers shared by server.py and bigtest_backupp.py
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify() call skips the stdlib encoder."""
+
+    # Non-str dict keys are stringified, as the stdlib provider does
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """jsonify() straight to bytes, skipping the str that dumps() would have Flask re-encode."""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self.option),
+                                        mimetype=self.mimetype)
+
+def read_json_body():
+    """Parse the request body with orjson, without keeping Flask's cached copy of the raw bytes."""
+    try:
+        return orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError as e:
+        abort(400, description=f"Failed to decode JSON object: {e}")
+
+class ModelsCache:
+    """Serialized /api/tags body, served until it expires because Copilot polls that endpoint."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.body = b""
+        self.expires = 0.0
+
+    def get(self):
+        """The cached body, or None once it has expired."""
+        return self.body if time.monotonic() < self.expires else None
+
+    def store(self, formatted):
+        """Serialize a formatted model list and return the body, caching it unless the list is empty."""
+        body = orjson.dumps({"models": formatted})
+        # An empty list usually means the model source failed or hasn't loaded yet, so don't pin it for a whole TTL
+        if formatted:
+            self.body = body
+            self.expires = time.monotonic() + self.ttl
+        return body
+
+    def invalidate(self):
+        self.expires = 0.0
+
+# Closing bytes of a chunk frame after its delta, for the finish_reason values the generators emit
+SSE_CHUNK_ENDS = {
+    None: b',"finish_reason":null}]}\n\n',
+    "stop": b',"finish_reason":"stop"}]}\n\n',
+    "error": b',"finish_reason":"error"}]}\n\n',
+}
+
+def sse_prefix(base):
+    """Serialize the fields shared by every chunk of a response (id/object/created/model) once.
+
+    The result is the opening bytes of a chat.completion.chunk frame, up to its delta; see sse_chunk.
+    """
+    return b"data: " + orjson.dumps(base)[:-1] + b',"choices":[{"index":0,"delta":'
+
+def sse_chunk(prefix, delta, finish_reason=None):
+    """Build one chat.completion.chunk SSE frame from an sse_prefix(), serializing only the delta."""
+    end = SSE_CHUNK_ENDS.get(finish_reason)
+    if end is None:
+        end = b',"finish_reason":' + orjson.dumps(finish_reason) + b'}]}\n\n'
+    return prefix + orjson.dumps(delta) + end
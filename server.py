@@ -1,10 +1,16 @@
 import time
 import requests
 from flask import Flask, request, jsonify, Response, stream_with_context
-import json
+import orjson
 import sys
 import os
+import logging
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
 import dotenv
+from proxy_common import OrjsonProvider, ModelsCache, read_json_body, sse_prefix, sse_chunk
 
 # Add AI_Engine to path
 # Use insert(0) to ensure local modules (like config.py) take precedence over installed packages
@@ -18,52 +24,106 @@ except ImportError as e:
     sys.exit(1)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Import our function executor
-from function_executor import parse_function_calls_from_text, execute_function_call, clean_content_for_display
+from function_executor import parse_and_clean_content, execute_function_call
 
 dotenv.load_dotenv()
 
+# Route the "api" logger and the function executor's "parser" logger to stderr
+# (LOG_LEVEL=DEBUG shows every request and every parsed call)
+logging.basicConfig(format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+log = logging.getLogger("api")
+for name in ("api", "parser"):
+    logging.getLogger(name).setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
 # Initialize AI Engine
 engine = AI_engine(verbose=True)
 shared_model_cache.load_cache()
 
 # AIEngine class removed as we are using the imported AI_engine module
 
-def strip_text_values(data):
-    """Recursively replaces all string values in a JSON object with an empty string."""
-    if isinstance(data, dict):
-        return {key: strip_text_values(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [strip_text_values(item) for item in data]
-    elif isinstance(data, str):
-        return ""  # Replace string with empty
-    else:
-        return data  # Keep numbers, booleans, etc.
+# Snapshots of the last request/response under logs/, written only when DEBUG_LOG is set.
+# A background thread does the serialization and disk I/O so the request path never waits on it.
+DEBUG_LOG = bool(os.getenv("DEBUG_LOG"))
+DEBUG_LOG_QUEUE = queue.Queue(maxsize=128)
+
+def write_debug_logs():
+    os.makedirs("logs", exist_ok=True)
+    while True:
+        path, data = DEBUG_LOG_QUEUE.get()
+        try:
+            with open(path, "wb") as f:
+                f.write(orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2))
+        except Exception as e:
+            log.warning("Failed to write %s: %s", path, e)
+
+def debug_log(path, data):
+    """Hand a snapshot to the writer thread; dropped when DEBUG_LOG is off or the writer is behind."""
+    if not DEBUG_LOG:
+        return
+    try:
+        DEBUG_LOG_QUEUE.put_nowait((path, data))
+    except queue.Full:
+        pass
+
+if DEBUG_LOG:
+    threading.Thread(target=write_debug_logs, name="debug-log-writer", daemon=True).start()
+
+MODELS_CACHE = ModelsCache(ttl=60)
+
+# Copilot often resends a request verbatim (retries, re-rendered turns). Successful engine results
+# without function calls are kept for a short while, keyed by exactly what the engine sees, so a
+# repeat skips the provider.
+COMPLETION_CACHE_TTL = 300
+COMPLETION_CACHE_SIZE = 256
+COMPLETION_CACHE = OrderedDict()  # key -> (expires, result), least recently used first
+COMPLETION_CACHE_LOCK = threading.Lock()
+
+def completion_cache_key(model, messages):
+    """Digest of the canonical JSON of the engine inputs"""
+    canonical = orjson.dumps({"model": model, "messages": messages}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(canonical).digest()
+
+def get_cached_completion(key):
+    with COMPLETION_CACHE_LOCK:
+        entry = COMPLETION_CACHE.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del COMPLETION_CACHE[key]
+            return None
+        COMPLETION_CACHE.move_to_end(key)
+        return entry[1]
+
+def store_completion(key, result):
+    with COMPLETION_CACHE_LOCK:
+        COMPLETION_CACHE[key] = (time.monotonic() + COMPLETION_CACHE_TTL, result)
+        COMPLETION_CACHE.move_to_end(key)
+        while len(COMPLETION_CACHE) > COMPLETION_CACHE_SIZE:
+            COMPLETION_CACHE.popitem(last=False)
 
 def process_function_calls_in_response(content):
     """Process any function calls found in the response content and execute them"""
-    function_calls = parse_function_calls_from_text(content)
+    # Parse the calls and clean the content for display (remove thinking and tool calls)
+    function_calls, cleaned_content = parse_and_clean_content(content)
     function_results = []
-    cleaned_content = content
     
     if function_calls:
-        print(f"[API] Found {len(function_calls)} function calls to execute")
-        
-        # Clean the content for display (remove thinking and tool calls)
-        cleaned_content = clean_content_for_display(content)
+        log.info("Found %d function calls to execute", len(function_calls))
         
         for func_call in function_calls:
             func_name = func_call["name"]
             params = func_call["parameters"]
-            print(f"[API] Executing function: {func_name} with params: {list(params.keys())}")
+            log.info("Executing function: %s with params: %s", func_name, list(params))
             
             result = execute_function_call(func_name, params)
             function_results.append({
                 "name": func_name,
                 "result": result
             })
-            print(f"[API] Function {func_name} result: {result}")
+            log.debug("Function %s result: %s", func_name, result)
     
     return function_results, cleaned_content
 
@@ -78,12 +138,17 @@ def add_headers(response):
 
 @app.route('/api/version', methods=['GET'])
 def version():
-    print("[API] GET /api/version")
+    log.debug("GET /api/version")
     return jsonify({"version": "1.0.0"})
 
 @app.route('/api/tags', methods=['GET'])
 def tags():
-    print("[API] GET /api/tags")
+    log.debug("GET /api/tags")
+    # Copilot polls this endpoint; serve the serialized list until it expires
+    body = MODELS_CACHE.get()
+    if body is not None:
+        return Response(body, mimetype="application/json")
+
     # Use shared_model_cache to get models
     if shared_model_cache.is_cache_valid():
         models = shared_model_cache.get_models()
@@ -108,13 +173,13 @@ def tags():
             "modified_at": modified_at,
             "size": 0
         })
-    return jsonify({"models": formatted})
+    return Response(MODELS_CACHE.store(formatted), mimetype="application/json")
 
 @app.route('/api/show', methods=['POST'])
 def show():
-    req = request.get_json(force=True)
+    req = read_json_body()
     model = req.get("model", "")
-    print(f"[API] POST /api/show: {model}")
+    log.debug("POST /api/show: %s", model)
     return jsonify({
         "template": model,
         "capabilities": ["tools", "function_call"],
@@ -128,34 +193,42 @@ def show():
 
 @app.route('/v1/chat/completions', methods=['POST'])
 def chat_completions():
-    req = request.get_json(force=True)
+    req = read_json_body()
     
     # Log request structure
-    with open('logs/last_copilot_request.json', 'w') as f:
-        json.dump(req, f, indent=2)
+    debug_log('logs/last_copilot_request.json', req)
     
     messages = req.get("messages", [])
     model = req.get("model")
     
-    print(f"[API] Requesting completion for model: {model}")
-
-    # Call AI Engine
-    # We use autodecide=True to let the engine pick the best provider if needed, 
-    # or it will use the specific model if found.
-    result = engine.chat_completion(
-        messages=messages,
-        model=model,
-        autodecide=True
-    )
-    
-    if not result.success:
-        print(f"[API] AI Engine failed: {result.error_message}")
-        return jsonify({"error": result.error_message}), 500
+    log.debug("Requesting completion for model: %s", model)
+
+    cache_key = completion_cache_key(model, messages)
+    result = get_cached_completion(cache_key)
+    if result is not None:
+        log.debug("Serving cached completion for model: %s", model)
+    else:
+        # Call AI Engine
+        # We use autodecide=True to let the engine pick the best provider if needed, 
+        # or it will use the specific model if found.
+        result = engine.chat_completion(
+            messages=messages,
+            model=model,
+            autodecide=True
+        )
         
-    print(f"[API] AI Engine success. Provider: {result.provider_used}, Model: {result.model_used}")
+        if not result.success:
+            log.error("AI Engine failed: %s", result.error_message)
+            return jsonify({"error": result.error_message}), 500
+        # Function calls are executed here on every response, so a cached replay would repeat
+        # their side effects (files, commands) without asking the model again
+        if not parse_and_clean_content(result.content)[0]:
+            store_completion(cache_key, result)
+        
+    log.debug("AI Engine success. Provider: %s, Model: %s", result.provider_used, result.model_used)
     
     # Save response for debugging
-    with open('logs/last_model_response.json', 'w') as f:
+    if DEBUG_LOG:
         # Create a dict representation of the result
         response_debug = {
             "content": result.content,
@@ -163,7 +236,7 @@ def chat_completions():
             "model": result.model_used,
             "raw_response": result.raw_response
         }
-        json.dump(response_debug, f, indent=2)
+        debug_log('logs/last_model_response.json', response_debug)
 
     # Process content for function calls
     # This handles parsing <think> tags (stripping them) and finding tool calls
@@ -173,25 +246,19 @@ def chat_completions():
     def fake_stream_response():
         completion_id = f"chatcmpl-{int(time.time())}"
         created = int(time.time())
+        prefix = sse_prefix({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": result.model_used
+        })
         
         # 1. Send Role
-        yield f"data: {json.dumps({
-            'id': completion_id,
-            'object': 'chat.completion.chunk',
-            'created': created,
-            'model': result.model_used,
-            'choices': [{'index': 0, 'delta': {'role': 'assistant'}, 'finish_reason': None}]
-        })}\n\n"
+        yield sse_chunk(prefix, {"role": "assistant"})
         
         # 2. Send Content (if any)
         if cleaned_content:
-            yield f"data: {json.dumps({
-                'id': completion_id,
-                'object': 'chat.completion.chunk',
-                'created': created,
-                'model': result.model_used,
-                'choices': [{'index': 0, 'delta': {'content': cleaned_content}, 'finish_reason': None}]
-            })}\n\n"
+            yield sse_chunk(prefix, {"content": cleaned_content})
             
         # 3. Send Tool Calls (if any)
         if function_results:
@@ -202,28 +269,16 @@ def chat_completions():
                     "type": "function",
                     "function": {
                         "name": func_result["name"],
-                        "arguments": json.dumps(func_result["result"])
+                        "arguments": orjson.dumps(func_result["result"]).decode()
                     }
                 })
             
-            yield f"data: {json.dumps({
-                'id': completion_id,
-                'object': 'chat.completion.chunk',
-                'created': created,
-                'model': result.model_used,
-                'choices': [{'index': 0, 'delta': {'tool_calls': tool_calls}, 'finish_reason': None}]
-            })}\n\n"
+            yield sse_chunk(prefix, {"tool_calls": tool_calls})
             
         # 4. Finish
-        yield f"data: {json.dumps({
-            'id': completion_id,
-            'object': 'chat.completion.chunk',
-            'created': created,
-            'model': result.model_used,
-            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
-        })}\n\n"
+        yield sse_chunk(prefix, {}, "stop")
         
-        yield "data: [DONE]\n\n"
+        yield b"data: [DONE]\n\n"
 
     return Response(stream_with_context(fake_stream_response()), mimetype="text/event-stream")
 
@@ -231,9 +286,10 @@ def chat_completions():
 @app.route("/", defaults={"path": ""}, methods=["GET", "POST"])
 @app.route("/<path:path>", methods=["GET", "POST"])
 def catch_all(path):
-    print(f"[API] WARNING: Hit unknown endpoint: {request.method} /{path}")
+    log.warning("Hit unknown endpoint: %s /%s", request.method, path)
     return jsonify({"error": "Not implemented"}), 404
 
 if __name__ == '__main__':
-    print("== Custom AI Backend Server for Copilot BYOK with Function Execution starting on localhost:11434 ==")
+    log.info("== Custom AI Backend Server for Copilot BYOK with Function Execution starting on localhost:11434 ==")
+    # Development server only; see the README for running under gunicorn
     app.run(host="localhost", port=11434)
\ No newline at end of file
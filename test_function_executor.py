@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+from function_executor import _MMAP_MIN_SIZE, _replace_function, execute_function_call, parse_and_clean_content, parse_function_calls_from_text
+
+@pytest.mark.skipif(os.name != "posix", reason="uses POSIX shell job syntax")
+def test_run_in_terminal_keeps_background_output_with_its_command():
+    first = execute_function_call("run_in_terminal", {"command": "(sleep 0.3; echo LATE; echo LATE >&2) & echo now"})
+    # Let the background child finish writing before the next command runs
+    time.sleep(0.5)
+    second = execute_function_call("run_in_terminal", {"command": "echo second"})
+    
+    assert first["stdout"].startswith("now\n")
+    assert second["stdout"] == "second\n"
+    assert second["stderr"] == ""
+
+@pytest.mark.parametrize("content", [None, ""])
+def test_missing_content_has_no_calls(content):
+    assert parse_function_calls_from_text(content) == []
+    assert parse_and_clean_content(content) == ([], content)
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("padding", [0, _MMAP_MIN_SIZE])
+def test_replace_function_result_does_not_depend_on_file_size(tmp_path, newline, padding):
+    filler = "x = 1\n" * (padding // 6 + 1) if padding else ""
+    lines = ["import os", "", "def target(a):", "    return a", "", "def other():", "    pass", ""]
+    path = tmp_path / "module.py"
+    path.write_bytes((filler + newline.join(lines)).encode())
+    
+    assert _replace_function(str(path), "target", "def target(a):\n    return a * 2\n")
+    
+    assert path.read_bytes() == (filler + "import os\n\ndef target(a):\n    return a * 2\n\n\ndef other():\n    pass\n").encode()
+
+def test_tool_call_json_keeps_nested_arguments():
+    content = '<tool_call>{"name": "create_file", "arguments": {"filePath": "a.json", "options": {"mode": {"append": false}}}}</tool_call>'
+    
+    assert parse_function_calls_from_text(content) == [
+        {"name": "create_file", "parameters": {"filePath": "a.json", "options": {"mode": {"append": False}}}}
+    ]
+
+def test_tool_call_json_decodes_escaped_quotes():
+    content = r'<tool_call>{"name": "insert_edit_into_file", "arguments": {"code": "a\"b", "filePath": "x.py"}}</tool_call>'
+    
+    assert parse_function_calls_from_text(content) == [
+        {"name": "insert_edit_into_file", "parameters": {"code": 'a"b', "filePath": "x.py"}}
+    ]
+
+def test_first_matching_tool_call_format_wins():
+    # A JSON tool call plus a ```json block describing the same call must only execute once
+    content = (
+        '<tool_call>{"name": "run_command", "arguments": {"command": "ls"}}</tool_call>\n'
+        '```json\n{"tool": "run_command", "command": "ls"}\n```'
+    )
+    
+    assert parse_function_calls_from_text(content) == [
+        {"name": "run_in_terminal", "parameters": {"command": "ls"}}
+    ]
+
+def test_content_without_call_markers_is_not_parsed():
+    content = 'Use {"name": "run_in_terminal", "arguments": {"command": "ls"}} to list files.'
+    
+    assert parse_function_calls_from_text(content) == []
+    assert parse_and_clean_content(content) == ([], content)
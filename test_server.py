@@ -1,218 +1,175 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from contextlib import nullcontext
+import orjson
+import pytest
 import time
 import os
 import sys
 
 BASE_URL = "http://localhost:11434"
+VERSION_URL = f"{BASE_URL}/api/version"
+TAGS_URL = f"{BASE_URL}/api/tags"
+SHOW_URL = f"{BASE_URL}/api/show"
+CHAT_URL = f"{BASE_URL}/v1/chat/completions"
 
-def print_pass(message):
-    print(f"✅ PASS: {message}")
+# Set DEBUG_SSE=1 to save each streaming test's raw SSE lines to a .log file
+DEBUG_SSE = bool(os.environ.get("DEBUG_SSE"))
 
-def print_fail(message, details=""):
-    print(f"❌ FAIL: {message}")
-    if details:
-        print(f"   Details: {details}")
+# The create_file tool schema is fixed, so build it once instead of per request
+CREATE_FILE_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "create_file",
+            "description": "Create a new file with the specified content",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filePath": {
+                        "type": "string",
+                        "description": "The absolute or relative path to the file"
+                    },
+                    "content": {
+                        "type": "string",
+                        "description": "The content to write to the file"
+                    }
+                },
+                "required": ["filePath", "content"]
+            }
+        }
+    }
+]
 
-def test_version():
-    print("\n--- Testing Version Endpoint ---")
-    try:
-        response = requests.get(f"{BASE_URL}/api/version")
-        if response.status_code == 200:
-            data = response.json()
-            if "version" in data:
-                print_pass(f"Version: {data['version']}")
-            else:
-                print_fail("Version key missing in response")
-        else:
-            print_fail(f"Status code: {response.status_code}")
-    except Exception as e:
-        print_fail(f"Exception: {e}")
-
-def test_list_models():
-    print("\n--- Testing List Models Endpoint ---")
-    try:
-        response = requests.get(f"{BASE_URL}/api/tags")
-        if response.status_code == 200:
-            data = response.json()
-            if "models" in data:
-                models = data["models"]
-                print_pass(f"Found {len(models)} models")
-                if len(models) > 0:
-                    print(f"   Sample model: {models[0]['name']}")
-                return models
-            else:
-                print_fail("Models key missing")
-        else:
-            print_fail(f"Status code: {response.status_code}")
-    except Exception as e:
-        print_fail(f"Exception: {e}")
-    return []
-
-def test_show_model(model_name):
-    print(f"\n--- Testing Show Model Endpoint ({model_name}) ---")
-    try:
-        response = requests.post(f"{BASE_URL}/api/show", json={"model": model_name})
-        if response.status_code == 200:
-            data = response.json()
-            if "model_info" in data:
-                print_pass("Model info received")
-            else:
-                print_fail("model_info missing")
-        else:
-            print_fail(f"Status code: {response.status_code}")
-    except Exception as e:
-        print_fail(f"Exception: {e}")
-
-def test_chat_basic():
-    print("\n--- Testing Basic Chat Completion ---")
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def open_sse_log(path):
+    """Open a raw SSE log for writing when DEBUG_SSE is set; otherwise a no-op context yielding None."""
+    return open(path, "wb") if DEBUG_SSE else nullcontext()
+
+def sse_log_note(path):
+    return f"Raw response saved to {path}" if DEBUG_SSE else "Set DEBUG_SSE=1 to save the raw response"
+
+def iter_sse_lines(response, chunk_size=16384):
+    """Yield the lines of a streamed response, splitting large reads on b"\\n" ourselves."""
+    pending = b""
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if pending:
+        yield pending.rstrip(b"\r")
+
+@pytest.fixture(scope="session")
+def session():
+    """One pooled requests.Session per test process, so keep-alive connections are reused.
+
+    Every test here goes through it, so they are all skipped when the server isn't reachable.
+    """
+    with requests.Session() as s:
+        s.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        # Check if server is up
+        try:
+            s.get(VERSION_URL, timeout=2)
+        except requests.exceptions.RequestException:
+            pytest.skip(f"Server is not running at {BASE_URL}. Please start server.py first.")
+        yield s
+
+@pytest.fixture(scope="session")
+def model_name(session):
+    response = session.get(TAGS_URL)
+    models = response.json().get("models") if response.status_code == 200 else None
+    return models[0]["name"] if models else "gpt-4"
+
+def test_version(session):
+    response = session.get(VERSION_URL)
+    assert response.status_code == 200
+    assert "version" in response.json(), "Version key missing in response"
+
+def test_list_models(session):
+    response = session.get(TAGS_URL)
+    assert response.status_code == 200
+    assert "models" in response.json(), "Models key missing"
+
+def test_show_model(session, model_name):
+    response = session.post(SHOW_URL, json={"model": model_name})
+    assert response.status_code == 200
+    assert "model_info" in response.json(), "model_info missing"
+
+def test_chat_basic(session):
     payload = {
         "messages": [{"role": "user", "content": "Say 'Hello World' and nothing else."}],
         "stream": True # Copilot usually requests stream
     }
     
-    try:
-        print("   Sending request...")
-        response = requests.post(f"{BASE_URL}/v1/chat/completions", json=payload, stream=True)
-        
-        if response.status_code == 200:
-            full_content = ""
-            raw_lines = []
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    raw_lines.append(line)
-                    if line.startswith("data: ") and line != "data: [DONE]":
-                        try:
-                            json_str = line[6:]
-                            chunk = json.loads(json_str)
-                            if "choices" in chunk and len(chunk["choices"]) > 0:
-                                delta = chunk["choices"][0].get("delta", {})
-                                if "content" in delta:
-                                    full_content += delta["content"]
-                        except:
-                            pass
-            
-            # Log raw response for debugging
-            with open("test_chat_basic_response.log", "w", encoding="utf-8") as f:
-                f.write("\n".join(raw_lines))
-            
-            print_pass(f"Response received: {full_content.strip()}")
-            if "Hello World" in full_content:
-                print_pass("Content verification successful")
-            else:
-                print(f"   Note: Content was '{full_content.strip()}'")
-                print(f"   Raw response saved to test_chat_basic_response.log")
-        else:
-            print_fail(f"Status code: {response.status_code}")
-            print(response.text)
-    except Exception as e:
-        print_fail(f"Exception: {e}")
-
-def test_function_calling():
-    print("\n--- Testing Function Calling (Tool Execution) ---")
+    response = session.post(CHAT_URL, data=orjson.dumps(payload), headers=JSON_HEADERS, stream=True)
+    assert response.status_code == 200, response.text
+    
+    content_parts = []
+    # Log raw response for debugging
+    with open_sse_log("test_chat_basic_response.log") as log:
+        for line in iter_sse_lines(response):
+            if line:
+                if log is not None:
+                    log.write(line)
+                    log.write(b"\n")
+                # Only object frames carry chunks; skips [DONE] without a parse attempt
+                if line.startswith(b"data: {"):
+                    try:
+                        chunk = orjson.loads(line[6:])
+                    except orjson.JSONDecodeError:
+                        continue
+                    if chunk.get("choices"):
+                        delta = chunk["choices"][0].get("delta", {})
+                        # Providers often send "content": null on role and finish chunks
+                        content = delta.get("content")
+                        if content and isinstance(content, str):
+                            content_parts.append(content)
+    full_content = "".join(content_parts)
+    
+    # The model is asked for "Hello World" but may word it differently; any reply means the stream works
+    assert full_content.strip(), f"No content received. {sse_log_note('test_chat_basic_response.log')}"
+
+def test_function_calling(session):
     # We will ask it to create a file.
     filename = "test_tool_output.txt"
     content_to_write = f"Timestamp: {time.time()}"
     
     # Clean up if exists
-    if os.path.exists(filename):
-        try:
-            os.remove(filename)
-        except:
-            pass
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
         
     payload = {
         "messages": [
             {"role": "system", "content": "You are a helpful assistant that can execute tools. When asked to create a file, use the create_file tool."},
             {"role": "user", "content": f"Please create a file named '{filename}' with the content '{content_to_write}'."}
         ],
-        "tools": [
-            {
-                "type": "function",
-                "function": {
-                    "name": "create_file",
-                    "description": "Create a new file with the specified content",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "filePath": {
-                                "type": "string",
-                                "description": "The absolute or relative path to the file"
-                            },
-                            "content": {
-                                "type": "string",
-                                "description": "The content to write to the file"
-                            }
-                        },
-                        "required": ["filePath", "content"]
-                    }
-                }
-            }
-        ],
+        "tools": CREATE_FILE_TOOLS,
         "stream": True
     }
     
-    try:
-        print(f"   Requesting file creation: {filename}")
-        response = requests.post(f"{BASE_URL}/v1/chat/completions", json=payload, stream=True)
-        
-        if response.status_code == 200:
-            # Consume the stream
-            full_response = ""
-            raw_lines = []
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    raw_lines.append(line)
-                    if line.startswith("data: ") and line != "data: [DONE]":
-                        full_response += line
-            
-            # Log raw response for debugging
-            with open("test_function_calling_response.log", "w", encoding="utf-8") as f:
-                f.write("\n".join(raw_lines))
-            
-            print("   Request completed.")
-            
-            # Check if file exists
-            if os.path.exists(filename):
-                with open(filename, 'r') as f:
-                    content = f.read()
-                if content == content_to_write:
-                    print_pass(f"File created with correct content: {content}")
-                else:
-                    print_fail(f"File created but content mismatch. Expected '{content_to_write}', got '{content}'")
-            else:
-                print_fail(f"File '{filename}' was not created.")
-                print("   Note: This might depend on the model's ability to call the tool correctly.")
-                print(f"   Raw response saved to test_function_calling_response.log")
-        else:
-            print_fail(f"Status code: {response.status_code}")
-            print(response.text)
-            
-    except Exception as e:
-        print_fail(f"Exception: {e}")
-
-if __name__ == "__main__":
-    print("Starting Server Tests...")
-    print(f"Target: {BASE_URL}")
+    response = session.post(CHAT_URL, data=orjson.dumps(payload), headers=JSON_HEADERS, stream=True)
+    assert response.status_code == 200, response.text
+    
+    # Consume the stream; only the tool's side effect is checked, so
+    # the SSE events are drained without being split or parsed
+    with open_sse_log("test_function_calling_response.log") as log:
+        for chunk in response.iter_content(chunk_size=65536):
+            if log is not None:
+                log.write(chunk)
     
-    # Check if server is up
+    # Check if file exists
     try:
-        requests.get(f"{BASE_URL}/api/version", timeout=2)
-    except requests.exceptions.ConnectionError:
-        print_fail("Server is not running. Please start server.py first.")
-        sys.exit(1)
+        with open(filename, 'r') as f:
+            content = f.read()
+    except FileNotFoundError:
+        # This might depend on the model's ability to call the tool correctly
+        pytest.fail(f"File '{filename}' was not created. {sse_log_note('test_function_calling_response.log')}")
+    assert content == content_to_write, "File created but content mismatch"
 
-    test_version()
-    models = test_list_models()
-    
-    if models:
-        test_show_model(models[0]['name'])
-    else:
-        test_show_model("gpt-4")
-        
-    test_chat_basic()
-    test_function_calling()
-    
-    print("\nTests Completed.")
+if __name__ == "__main__":
+    # Kept so `python test_server.py` still works; extra arguments go to pytest (e.g. -n 4 with pytest-xdist)
+    sys.exit(pytest.main([__file__, *sys.argv[1:]]))